@@ -0,0 +1,22 @@
+#!/bin/sh
+# Роль и правило pg_hba.conf для потоковой реплики db_replica.
+# При создании базы скрипт выполняется автоматически. Для базы, созданной раньше,
+# его достаточно один раз запустить вручную, данные при этом не теряются:
+#   docker-compose exec db sh /docker-entrypoint-initdb.d/create_replication_user.sh
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<'SQL'
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'replicator') THEN
+    CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD 'replicator';
+  END IF;
+END
+$$;
+SQL
+
+if ! grep -q "^host replication replicator" "$PGDATA/pg_hba.conf"; then
+  echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
+  psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" \
+    -c "SELECT pg_reload_conf();"
+fi
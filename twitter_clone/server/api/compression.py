@@ -0,0 +1,93 @@
+import gzip
+from typing import Dict, Optional
+
+from api.metrics import Metrics  # type: ignore
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    Кодировки из заголовка Accept-Encoding с их весами q
+    """
+    encodings = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """
+    Выбрать кодировку ответа: brotli (если установлен), иначе gzip
+    """
+    encodings = parse_accept_encoding(header)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    for name in candidates:
+        if encodings.get(name, encodings.get("*", 0)) > 0:
+            return name
+    return None
+
+
+def compress_response(
+    response: Response, accept_encoding: str, min_size: int, metrics: Metrics
+) -> Response:
+    """
+    Сжать ответ, если клиент это поддерживает и ответ не меньше min_size байт.
+    Потоковые ответы (SSE, NDJSON) не сжимаются, чтобы не буферизовать их
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+    ):
+        return response
+    if not (
+        response.mimetype.startswith("text/")
+        or response.mimetype in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=5)
+    else:
+        compressed = gzip.compress(data, compresslevel=6)
+    if len(compressed) >= len(data):
+        return response
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    metrics.increment(f"compression.{encoding}.responses")
+    metrics.increment("compression.bytes_in", len(data))
+    metrics.increment("compression.bytes_out", len(compressed))
+    metrics.increment("compression.bytes_saved", len(data) - len(compressed))
+    return response
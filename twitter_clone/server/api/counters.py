@@ -0,0 +1,130 @@
+from typing import List
+
+from db.models import Follow, Like, Tweet, User, db  # type: ignore
+from sqlalchemy import func, inspect, or_, select, text, update
+
+RECONCILE_BATCH_SIZE = 1000
+COUNTER_COLUMNS = (
+    "followers_count",
+    "following_count",
+    "tweets_count",
+    "likes_received_count",
+)
+
+
+def change_counters(user_id: int, **deltas: int) -> None:
+    """
+    Атомарно изменить счётчики пользователя в текущей транзакции,
+    например change_counters(1, tweets_count=1)
+    """
+    values = {name: getattr(User, name) + delta for name, delta in deltas.items()}
+    db.session.execute(update(User).where(User.id == user_id).values(values))
+
+
+def change_follow_counters(follower_id: int, followed_id: int, delta: int) -> None:
+    """
+    Изменить счётчики подписок follower_id и подписчиков followed_id на delta.
+    Строки блокируются в порядке возрастания id: иначе два пользователя,
+    одновременно подписывающиеся друг на друга, блокируют строки в разном
+    порядке и попадают во взаимную блокировку
+    """
+    deltas = {
+        follower_id: {"following_count": delta},
+        followed_id: {"followers_count": delta},
+    }
+    for user_id in sorted(deltas):
+        change_counters(user_id, **deltas[user_id])
+
+
+def actual_counters() -> dict:
+    """
+    Подзапросы с фактическими значениями счётчиков для строки таблицы users
+    """
+    return {
+        "followers_count": select(func.count())
+        .select_from(Follow)
+        .where(Follow.followed_id == User.id)
+        .scalar_subquery(),
+        "following_count": select(func.count())
+        .select_from(Follow)
+        .where(Follow.follower_id == User.id)
+        .scalar_subquery(),
+        "tweets_count": select(func.count())
+        .select_from(Tweet)
+        .where(Tweet.user_id == User.id)
+        .scalar_subquery(),
+        "likes_received_count": select(func.count())
+        .select_from(Like)
+        .join(Tweet, Tweet.id == Like.tweet_id)
+        .where(Tweet.user_id == User.id)
+        .scalar_subquery(),
+    }
+
+
+def reconcile_counters(batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Пересчитать счётчики пользователей пачками по batch_size пользователей,
+    каждая пачка — отдельная короткая транзакция.
+    Возвращает количество исправленных пользователей
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return fixed
+
+        counters = actual_counters()
+        drifted = [getattr(User, name) != value for name, value in counters.items()]
+        result = db.session.execute(
+            update(User)
+            .where(User.id.between(ids[0], ids[-1]))
+            .where(or_(*drifted))
+            .values(counters)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        fixed += result.rowcount
+        last_id = ids[-1]
+
+
+def missing_counter_columns() -> List[str]:
+    columns = inspect(db.session.connection()).get_columns(User.__tablename__)
+    existing = {column["name"] for column in columns}
+    return [name for name in COUNTER_COLUMNS if name not in existing]
+
+
+def add_counter_columns() -> List[str]:
+    """
+    Добавить столбцы счётчиков в таблицу users, созданную до их появления:
+    db.create_all() существующие таблицы не изменяет. Таблица блокируется,
+    чтобы одновременно запущенные серверы не добавляли столбцы дважды.
+    Возвращает добавленные столбцы
+    """
+    if not missing_counter_columns():
+        db.session.rollback()
+        return []
+
+    db.session.execute(text("LOCK TABLE users IN ACCESS EXCLUSIVE MODE"))
+    missing = missing_counter_columns()
+    for name in missing:
+        db.session.execute(
+            text(
+                f"ALTER TABLE users ADD COLUMN IF NOT EXISTS {name} "
+                "INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+    db.session.commit()
+    return missing
+
+
+def migrate_counters(batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """
+    Добавить недостающие столбцы счётчиков и заполнить их фактическими значениями.
+    Возвращает количество пользователей, счётчики которых были заполнены
+    """
+    if not add_counter_columns():
+        return 0
+    return reconcile_counters(batch_size)
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import zmq
+
+EVENTS_PUB_ADDR = os.environ.get(
+    "EVENTS_PUB_ADDR", "ipc:///tmp/twitter_clone_events_in"
+)
+EVENTS_SUB_ADDR = os.environ.get(
+    "EVENTS_SUB_ADDR", "ipc:///tmp/twitter_clone_events_out"
+)
+# Адреса, на которых шина принимает подключения. Отличаются от адресов
+# подключения, если воркеры работают в разных контейнерах (tcp://*:5557)
+EVENTS_PUB_BIND = os.environ.get("EVENTS_PUB_BIND", EVENTS_PUB_ADDR)
+EVENTS_SUB_BIND = os.environ.get("EVENTS_SUB_BIND", EVENTS_SUB_ADDR)
+
+# Служебный топик лайков для топа популярных твитов в каждом воркере
+TRENDING_TOPIC = b"trending."
+# Служебный топик, через который воркеры обмениваются счётчиками /api/metrics
+METRICS_TOPIC = b"metrics."
+
+
+def user_topic(user_id: int) -> bytes:
+    """
+    Топик событий пользователя. Завершающая точка не даёт подписке
+    на user.1. получать события user.12.
+    """
+    return f"user.{user_id}.".encode()
+
+
+def run_proxy(
+    pub_addr: str, sub_addr: str, context: Optional[zmq.Context] = None
+) -> None:
+    """
+    Шина событий: воркеры публикуют в pub_addr, подписчики читают из sub_addr
+    """
+    context = context or zmq.Context()
+    frontend = context.socket(zmq.XSUB)
+    frontend.bind(pub_addr)
+    backend = context.socket(zmq.XPUB)
+    backend.bind(sub_addr)
+    try:
+        zmq.proxy(frontend, backend)
+    finally:
+        frontend.close(linger=0)
+        backend.close(linger=0)
+
+
+def start_proxy(
+    pub_addr: str = EVENTS_PUB_ADDR,
+    sub_addr: str = EVENTS_SUB_ADDR,
+    context: Optional[zmq.Context] = None,
+) -> threading.Thread:
+    """
+    Запустить шину событий в фоновом потоке
+    """
+    thread = threading.Thread(
+        target=run_proxy,
+        args=(pub_addr, sub_addr, context),
+        name="events-proxy",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+class EventBus:
+    """
+    Публикация и получение событий через ZeroMQ pub/sub.
+    Сокеты ZeroMQ не потокобезопасны, поэтому у каждого потока свой PUB-сокет
+    """
+
+    def __init__(
+        self,
+        pub_addr: str = EVENTS_PUB_ADDR,
+        sub_addr: str = EVENTS_SUB_ADDR,
+        context: Optional[zmq.Context] = None,
+    ) -> None:
+        self.pub_addr = pub_addr
+        self.sub_addr = sub_addr
+        self._context = context
+        self._local = threading.local()
+
+    @property
+    def context(self) -> zmq.Context:
+        # Context.instance() пересоздаёт контекст после fork воркера gunicorn
+        return self._context or zmq.Context.instance()
+
+    def _publisher(self) -> zmq.Socket:
+        socket = getattr(self._local, "socket", None)
+        if socket is None:
+            socket = self.context.socket(zmq.PUB)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(self.pub_addr)
+            self._local.socket = socket
+        return socket
+
+    def send(self, topic: bytes, event: str, data: Dict[str, Any]) -> None:
+        """
+        Опубликовать событие в топик topic
+        """
+        message = json.dumps({"event": event, "data": data}).encode()
+        self._publisher().send_multipart([topic, message])
+
+    def publish(self, user_id: int, event: str, data: Dict[str, Any]) -> None:
+        """
+        Опубликовать событие пользователя user_id
+        """
+        self.send(user_topic(user_id), event, data)
+
+    def subscribe(
+        self, user_ids: Iterable[int], timeout: float
+    ) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Получать события пользователей user_ids.
+        Если за timeout секунд событий не было, отдаётся None
+        """
+        return self.listen([user_topic(user_id) for user_id in user_ids], timeout)
+
+    def listen(
+        self, topics: Iterable[bytes], timeout: float
+    ) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Получать события из топиков topics.
+        Если за timeout секунд событий не было, отдаётся None
+        """
+        socket = self.context.socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(self.sub_addr)
+        for topic in topics:
+            socket.setsockopt(zmq.SUBSCRIBE, topic)
+        try:
+            while True:
+                if socket.poll(int(timeout * 1000)):
+                    _, message = socket.recv_multipart()
+                    yield json.loads(message)
+                else:
+                    yield None
+        finally:
+            socket.close()
+
+
+def iter_sse(bus: EventBus, user_ids: Iterable[int], heartbeat: float) -> Iterator[str]:
+    """
+    Поток событий в формате server-sent events.
+    Комментарий-пинг раз в heartbeat секунд держит соединение открытым
+    и позволяет заметить отключение клиента
+    """
+    yield "retry: 3000\n\n"
+    for event in bus.subscribe(user_ids, timeout=heartbeat):
+        if event is None:
+            yield ": ping\n\n"
+        else:
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
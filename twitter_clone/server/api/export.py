@@ -0,0 +1,81 @@
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+from db.models import Follow, Like, Media, Tweet, User, db  # type: ignore
+from sqlalchemy import Select, or_, select
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _iter_rows(query: Select, batch_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Построчное чтение результата запроса через серверный курсор пачками
+    по batch_size строк
+    """
+    result = db.session.execute(
+        query.execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for row in result.mappings():
+        yield dict(row)
+
+
+def _record(record_type: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"type": record_type, "data": data}, ensure_ascii=False) + "\n"
+
+
+def iter_user_export(user: User, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """
+    Выгрузить профиль (без api-ключа), твиты, медиафайлы, лайки и подписки
+    пользователя построчно в формате NDJSON
+    """
+    yield _record("user", user.to_public_json())
+
+    tweets = select(Tweet.__table__).where(Tweet.user_id == user.id).order_by(Tweet.id)
+    for row in _iter_rows(tweets, batch_size):
+        yield _record("tweet", row)
+
+    medias = (
+        select(Media.__table__)
+        .join(Tweet, Tweet.id == Media.tweet_id)
+        .where(Tweet.user_id == user.id)
+        .order_by(Media.id)
+    )
+    for row in _iter_rows(medias, batch_size):
+        yield _record("media", row)
+
+    likes = select(Like.__table__).where(Like.user_id == user.id).order_by(Like.id)
+    for row in _iter_rows(likes, batch_size):
+        yield _record("like", row)
+
+    follows = (
+        select(Follow.__table__)
+        .where(or_(Follow.follower_id == user.id, Follow.followed_id == user.id))
+        .order_by(Follow.follower_id, Follow.followed_id)
+    )
+    for row in _iter_rows(follows, batch_size):
+        yield _record("follow", row)
+
+
+def iter_chunks(
+    lines: Iterable[str], chunk_bytes: int = EXPORT_CHUNK_BYTES
+) -> Iterator[bytes]:
+    """
+    Склеить строки в блоки примерно по chunk_bytes байт, чтобы не отправлять
+    клиенту каждую строку отдельной записью в сокет.
+    Первая строка отдаётся сразу, чтобы загрузка началась без задержки
+    """
+    buffer = []
+    size = 0
+    first = True
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if first or size >= chunk_bytes:
+            first = False
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
@@ -0,0 +1,98 @@
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from db.models import Follow, Tweet, User, db  # type: ignore
+from flask import Response, jsonify
+from sqlalchemy.orm import load_only, selectinload
+
+TWEET_FIELDS = {c.name for c in Tweet.__table__.columns}
+TWEET_INCLUDES = {"author", "likes", "medias"}
+TRENDING_DEFAULT_INCLUDES = {"author", "medias"}
+PROFILE_FIELDS = {
+    "id",
+    "name",
+    "followers_count",
+    "following_count",
+    "tweets_count",
+    "likes_received_count",
+}
+PROFILE_DEFAULT_FIELDS = {"id", "name"}
+PROFILE_INCLUDES = {"followers", "following"}
+
+
+def parse_fieldset(
+    value: Optional[str], allowed: Set[str]
+) -> Union[Optional[Set[str]], Tuple[Response, int]]:
+    """
+    Разобрать параметр запроса fields= или include= (имена через запятую).
+    Без параметра возвращается None — «все поля», пустой параметр — пустой набор
+    """
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - allowed
+    if unknown:
+        return (
+            jsonify(
+                {
+                    "result": False,
+                    "error_type": "InvalidInput",
+                    "error_message": f"Unknown fields: {', '.join(sorted(unknown))}",
+                }
+            ),
+            400,
+        )
+    return names
+
+
+def tweet_load_options(
+    fields: Optional[Set[str]], include: Optional[Set[str]]
+) -> List[Any]:
+    """
+    Загружать только запрошенные столбцы твита и связанные объекты —
+    последние одним дополнительным запросом на каждую связь, а не на каждый твит.
+    id загружается всегда: без него не загрузить связи, а load_only
+    не принимает пустой список столбцов (fields=)
+    """
+    options: List[Any] = []
+    if include is None:
+        include = TWEET_INCLUDES
+    if fields is not None:
+        columns = fields | {"id"}
+        if "author" in include:
+            columns.add("user_id")
+        options.append(load_only(*(getattr(Tweet, name) for name in columns)))
+    for name in include:
+        options.append(selectinload(getattr(Tweet, name)))
+    return options
+
+
+def user_profile(
+    user: User, fields: Optional[Set[str]], include: Optional[Set[str]]
+) -> Dict[str, Any]:
+    """
+    Профиль пользователя с запрошенными полями и списками подписчиков и подписок.
+    Счётчики берутся из строки пользователя, списки загружаются, только если запрошены
+    """
+    if fields is None:
+        fields = PROFILE_DEFAULT_FIELDS
+    if include is None:
+        include = PROFILE_INCLUDES
+
+    profile = {name: getattr(user, name) for name in sorted(fields)}
+    if "followers" in include:
+        profile["followers"] = [
+            follower.to_public_json()
+            for follower in db.session.query(User)
+            .join(Follow, Follow.follower_id == User.id)
+            .filter(Follow.followed_id == user.id)
+            .all()
+        ]
+    if "following" in include:
+        profile["following"] = [
+            followed.to_public_json()
+            for followed in db.session.query(User)
+            .join(Follow, Follow.followed_id == User.id)
+            .filter(Follow.follower_id == user.id)
+            .all()
+        ]
+    return profile
@@ -1,14 +1,56 @@
+import atexit
 import os
+import time
 from typing import Tuple, Union
 
-from db.models import Follow, Like, Media, Tweet, User, db  # type: ignore
+import click
+from api.compression import compress_response  # type: ignore
+from api.counters import (  # type: ignore
+    change_counters,
+    change_follow_counters,
+    reconcile_counters,
+)
+from api.events import (  # type: ignore
+    EVENTS_PUB_ADDR,
+    EVENTS_SUB_ADDR,
+    EventBus,
+    iter_sse,
+)
+from api.export import iter_chunks, iter_user_export  # type: ignore
+from api.fieldsets import (  # type: ignore
+    PROFILE_FIELDS,
+    PROFILE_INCLUDES,
+    TRENDING_DEFAULT_INCLUDES,
+    TWEET_FIELDS,
+    TWEET_INCLUDES,
+    parse_fieldset,
+    tweet_load_options,
+    user_profile,
+)
+from api.metrics import Metrics  # type: ignore
+from api.suggestions import compute_suggestions  # type: ignore
+from api.trending import TrendingTweets  # type: ignore
+from db.models import (  # type: ignore
+    Follow,
+    Like,
+    Media,
+    Suggestion,
+    Tweet,
+    User,
+    db,
+)
+from db.routing import (  # type: ignore
+    ReplicaHealth,
+    StickyPrimary,
+    read_only,
+    replica_binds,
+)
 from faker import Faker
 from flasgger import Swagger
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from tests.factories import UserFactory  # type: ignore
 from werkzeug.utils import secure_filename
-from werkzeug.wrappers import Response
 
 fake = Faker("en_US")
 UPLOAD_FOLDER = "db/uploads"
@@ -47,15 +89,123 @@ def create_app(test_config=None) -> Flask:
             "postgresql+psycopg2://admin:admin@db:5432/twitter_clone"
         )
         app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-    app.config['DEBUG'] = True
+        app.config["TRENDING_CHECKPOINT_PATH"] = "db/trending.json"
+        app.config["SQLALCHEMY_REPLICA_URIS"] = [
+            uri
+            for uri in os.environ.get("SQLALCHEMY_REPLICA_URIS", "").split(",")
+            if uri
+        ]
+    app.config["DEBUG"] = True
+    app.config.setdefault("EVENTS_PUB_ADDR", EVENTS_PUB_ADDR)
+    app.config.setdefault("EVENTS_SUB_ADDR", EVENTS_SUB_ADDR)
+    app.config.setdefault("EVENTS_HEARTBEAT", 15)
+    app.config.setdefault("TRENDING_WINDOW", 3600)
+    app.config.setdefault("TRENDING_BUCKETS", 60)
+    app.config.setdefault("TRENDING_TOP_K", 100)
+    app.config.setdefault("TRENDING_CHECKPOINT_PATH", None)
+    app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+    app.config.setdefault("REPLICA_RETRY_SECONDS", 30)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("METRICS_PUBLISH_INTERVAL", 5)
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        {
+            "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10)),
+            # Проверять соединение из пула, чтобы заметить перезапуск или отказ реплики
+            "pool_pre_ping": True,
+        },
+    )
+    app.config["SQLALCHEMY_BINDS"] = {
+        **app.config.get("SQLALCHEMY_BINDS", {}),
+        **replica_binds(app.config.get("SQLALCHEMY_REPLICA_URIS", [])),
+    }
 
     db.init_app(app)
+    sticky_primary = StickyPrimary(app.config["REPLICA_STICKY_SECONDS"])
+    app.extensions["sticky_primary"] = sticky_primary
+    app.extensions["replica_health"] = ReplicaHealth(
+        app.config["REPLICA_RETRY_SECONDS"]
+    )
+    event_bus = EventBus(app.config["EVENTS_PUB_ADDR"], app.config["EVENTS_SUB_ADDR"])
+    app.extensions["event_bus"] = event_bus
+    metrics = Metrics(event_bus, app.config["METRICS_PUBLISH_INTERVAL"])
+    app.extensions["metrics"] = metrics
+    trending = TrendingTweets(
+        window=app.config["TRENDING_WINDOW"],
+        buckets=app.config["TRENDING_BUCKETS"],
+        top_k=app.config["TRENDING_TOP_K"],
+        checkpoint_path=app.config["TRENDING_CHECKPOINT_PATH"],
+        bus=event_bus,
+    )
+    app.extensions["trending"] = trending
+    atexit.register(trending.checkpoint)
     Swagger(app, template_file="swagger_cals.yaml")
 
     @app.teardown_appcontext
     def shutdown_session(exception=None) -> None:
         db.session.remove()
 
+    @app.after_request
+    def remember_writes(response: Response) -> Response:
+        """
+        После успешной записи читать данные пользователя из основной базы
+        """
+        is_write = request.method not in ("GET", "HEAD", "OPTIONS")
+        if is_write and response.status_code < 400:
+            sticky_primary.mark(response)
+        return response
+
+    @app.after_request
+    def compress(response: Response) -> Response:
+        """
+        Сжать ответ в gzip или brotli по заголовку Accept-Encoding
+        """
+        return compress_response(
+            response,
+            request.headers.get("Accept-Encoding", ""),
+            app.config["COMPRESS_MIN_SIZE"],
+            metrics,
+        )
+
+    @app.cli.command("export-user")
+    @click.argument("user_id", type=int)
+    @click.option("--output", "-o", type=click.File("w"), default="-")
+    def export_user_command(user_id: int, output) -> None:
+        """
+        Выгрузить данные пользователя в формате NDJSON
+        """
+        user = db.session.get(User, user_id)
+        if user is None:
+            raise click.ClickException(f"User {user_id} not found.")
+        for line in iter_user_export(user):
+            output.write(line)
+
+    @app.cli.command("reconcile-counters")
+    @click.option("--batch-size", type=int, default=1000)
+    @click.option("--interval", type=int, default=0, help="Повторять каждые N секунд")
+    def reconcile_counters_command(batch_size: int, interval: int) -> None:
+        """
+        Исправить расхождения счётчиков пользователей с фактическими данными
+        """
+        while True:
+            fixed = reconcile_counters(batch_size)
+            click.echo(f"Reconciled counters of {fixed} users.")
+            if not interval:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("compute-suggestions")
+    @click.option("--top-n", type=int, default=20)
+    @click.option("--chunk-size", type=int, default=10000)
+    @click.option("--workers", type=int, default=None, help="По умолчанию — число ядер")
+    def compute_suggestions_command(top_n: int, chunk_size: int, workers: int) -> None:
+        """
+        Пересчитать рекомендации «на кого подписаться»
+        """
+        saved = compute_suggestions(top_n, chunk_size, workers)
+        click.echo(f"Saved {saved} suggestions.")
+
     @app.route("/api", methods=["GET"])
     def populating_db() -> Tuple[Response, int]:
         """
@@ -80,6 +230,15 @@ def create_app(test_config=None) -> Flask:
             200,
         )
 
+    @app.route("/api/metrics", methods=["GET"])
+    def get_metrics() -> Tuple[Response, int]:
+        """
+        Получить счётчики (в том числе сэкономленные сжатием байты),
+        просуммированные по всем воркерам, и pid этих воркеров
+        """
+        total, pids = metrics.aggregate()
+        return jsonify({"result": True, "metrics": total, "workers": pids}), 200
+
     @app.route("/api/tweets", methods=["POST"])
     def create_tweet() -> Tuple[Response, int]:
         """
@@ -97,6 +256,7 @@ def create_app(test_config=None) -> Flask:
             user_id=user.id, content=tweet_data, medias_ids=tweet_media_ids
         )
         db.session.add(new_tweet)
+        change_counters(user.id, tweets_count=1)
         db.session.flush()
 
         for media_id in tweet_media_ids:
@@ -104,6 +264,7 @@ def create_app(test_config=None) -> Flask:
             if media is not None:
                 media.tweet_id = new_tweet.id
         db.session.commit()
+        event_bus.publish(user.id, "tweet", new_tweet.to_json())
 
         return jsonify({"result": True, "tweet_id": new_tweet.id}), 201
 
@@ -169,8 +330,11 @@ def create_app(test_config=None) -> Flask:
                 400,
             )
         else:
+            likes = db.session.query(Like).filter_by(tweet_id=tweet.id).count()
+            change_counters(user.id, tweets_count=-1, likes_received_count=-likes)
             db.session.delete(tweet)
             db.session.commit()
+            trending.discard(tweet_id)
             return jsonify({"result": True}), 201
 
     @app.route("/api/tweets/<int:tweet_id>/likes", methods=["POST"])
@@ -200,7 +364,14 @@ def create_app(test_config=None) -> Flask:
             tweet.count_likes += 1
             like = Like(user_id=user.id, tweet_id=tweet.id)
             db.session.add(like)
+            change_counters(tweet.user_id, likes_received_count=1)
             db.session.commit()
+            trending.record(tweet.id, 1)
+            event_bus.publish(
+                tweet.user_id,
+                "likes",
+                {"tweet_id": tweet.id, "count_likes": tweet.count_likes},
+            )
             return jsonify({"result": True}), 201
 
     @app.route("/api/tweets/<int:tweet_id>/likes", methods=["DELETE"])
@@ -235,7 +406,14 @@ def create_app(test_config=None) -> Flask:
             if tweet.count_likes > 0:
                 tweet.count_likes -= 1
                 db.session.delete(like)
+                change_counters(tweet.user_id, likes_received_count=-1)
                 db.session.commit()
+                trending.record(tweet.id, -1)
+                event_bus.publish(
+                    tweet.user_id,
+                    "likes",
+                    {"tweet_id": tweet.id, "count_likes": tweet.count_likes},
+                )
                 return jsonify({"result": True}), 201
 
     @app.route("/api/users/<int:user_id>/follow", methods=["POST"])
@@ -258,6 +436,7 @@ def create_app(test_config=None) -> Flask:
             if not follow:
                 follow = Follow(follower_id=user.id, followed_id=user_id)
                 db.session.add(follow)
+                change_follow_counters(user.id, user_id, 1)
                 db.session.commit()
                 return jsonify({"result": True}), 201
             else:
@@ -312,10 +491,12 @@ def create_app(test_config=None) -> Flask:
             )
         else:
             db.session.delete(follow)
+            change_follow_counters(user.id, user_id, -1)
             db.session.commit()
             return jsonify({"result": True}), 201
 
     @app.route("/api/tweets", methods=["GET"])
+    @read_only
     def get_tweets() -> Tuple[Response, int]:
         """
         Получить ленту с твитами
@@ -326,6 +507,13 @@ def create_app(test_config=None) -> Flask:
         if isinstance(user, tuple):
             return user
 
+        fields = parse_fieldset(request.args.get("fields"), TWEET_FIELDS)
+        if isinstance(fields, tuple):
+            return fields
+        include = parse_fieldset(request.args.get("include"), TWEET_INCLUDES)
+        if isinstance(include, tuple):
+            return include
+
         followed_users = [
             f.followed_id
             for f in db.session.query(Follow).filter_by(follower_id=user.id).all()
@@ -343,6 +531,7 @@ def create_app(test_config=None) -> Flask:
 
         tweets = (
             db.session.query(Tweet)
+            .options(*tweet_load_options(fields, include))
             .filter(Tweet.user_id.in_(followed_users))
             .order_by(Tweet.count_likes.desc())
             .all()
@@ -351,16 +540,17 @@ def create_app(test_config=None) -> Flask:
             jsonify(
                 {
                     "result": True,
-                    "tweets": [tweet.to_json() for tweet in tweets],
+                    "tweets": [tweet.to_json(fields, include) for tweet in tweets],
                 }
             ),
             200,
         )
 
-    @app.route("/api/users/me", methods=["GET"])
-    def get_my_profile() -> Tuple[Response, int]:
+    @app.route("/api/tweets/trending", methods=["GET"])
+    @read_only
+    def get_trending_tweets() -> Tuple[Response, int]:
         """
-        Получить информацию о своём профиле
+        Получить самые популярные твиты за последнее время
         """
         api_key = request.headers.get("api-key")
         user = authenticate_user(api_key)
@@ -368,50 +558,132 @@ def create_app(test_config=None) -> Flask:
         if isinstance(user, tuple):
             return user
 
-        followers = [
-            f.follower_id
-            for f in db.session.query(Follow).filter_by(followed_id=user.id).all()
-        ]
-        following = [
+        fields = parse_fieldset(request.args.get("fields"), TWEET_FIELDS)
+        if isinstance(fields, tuple):
+            return fields
+        include = parse_fieldset(request.args.get("include"), TWEET_INCLUDES)
+        if isinstance(include, tuple):
+            return include
+        if include is None:
+            # Списки лайков самых популярных твитов слишком велики
+            include = TRENDING_DEFAULT_INCLUDES
+
+        limit = request.args.get("limit", 10, type=int)
+        top = trending.top(min(max(limit, 1), trending.top_k))
+        if not top:
+            return jsonify({"result": True, "tweets": []}), 200
+
+        tweets = {
+            tweet.id: tweet
+            for tweet in db.session.query(Tweet)
+            .options(*tweet_load_options(fields, include))
+            .filter(Tweet.id.in_([tweet_id for tweet_id, _ in top]))
+            .all()
+        }
+        trending_tweets = []
+        for tweet_id, score in top:
+            if tweet_id in tweets:
+                tweet_data = tweets[tweet_id].to_json(fields, include)
+                tweet_data["trending_likes"] = score
+                trending_tweets.append(tweet_data)
+        return jsonify({"result": True, "tweets": trending_tweets}), 200
+
+    @app.route("/api/tweets/stream", methods=["GET"])
+    @read_only
+    def stream_tweets() -> Tuple[Response, int]:
+        """
+        Получать новые твиты и изменения числа лайков от отслеживаемых
+        пользователей в виде server-sent events.
+        EventSource в браузере не умеет передавать заголовки,
+        поэтому api-key можно передать и параметром запроса api_key
+        """
+        api_key = request.headers.get("api-key") or request.args.get("api_key")
+        user = authenticate_user(api_key)
+
+        if isinstance(user, tuple):
+            return user
+
+        followed_users = [
             f.followed_id
             for f in db.session.query(Follow).filter_by(follower_id=user.id).all()
         ]
+        # Соединение с БД не нужно на всё время жизни потока
+        db.session.remove()
 
-        if not followers:
-            followers_users = []
-        else:
-            followers_users = [
-                user.to_json()
-                for user in db.session.query(User).filter(User.id.in_(followers)).all()
-            ]
+        return (
+            Response(
+                iter_sse(event_bus, followed_users, app.config["EVENTS_HEARTBEAT"]),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            ),
+            200,
+        )
 
-        if not following:
-            following_users = []
-        else:
-            following_users = [
-                user.to_json()
-                for user in db.session.query(User).filter(User.id.in_(following)).all()
-            ]
+    @app.route("/api/users/me", methods=["GET"])
+    @read_only
+    def get_my_profile() -> Tuple[Response, int]:
+        """
+        Получить информацию о своём профиле
+        """
+        api_key = request.headers.get("api-key")
+        user = authenticate_user(api_key)
+
+        if isinstance(user, tuple):
+            return user
+
+        fields = parse_fieldset(request.args.get("fields"), PROFILE_FIELDS)
+        if isinstance(fields, tuple):
+            return fields
+        include = parse_fieldset(request.args.get("include"), PROFILE_INCLUDES)
+        if isinstance(include, tuple):
+            return include
 
+        return (
+            jsonify({"result": True, "user": user_profile(user, fields, include)}),
+            200,
+        )
+
+    @app.route("/api/users/me/suggestions", methods=["GET"])
+    @read_only
+    def get_my_suggestions() -> Tuple[Response, int]:
+        """
+        Получить рекомендации, на кого подписаться
+        """
+        api_key = request.headers.get("api-key")
+        user = authenticate_user(api_key)
+
+        if isinstance(user, tuple):
+            return user
+
+        followed_users = db.session.query(Follow.followed_id).filter_by(
+            follower_id=user.id
+        )
+        suggestions = (
+            db.session.query(Suggestion.score, User.id, User.name)
+            .join(User, User.id == Suggestion.candidate_id)
+            .filter(Suggestion.user_id == user.id)
+            .filter(Suggestion.candidate_id.not_in(followed_users))
+            .order_by(Suggestion.rank)
+            .all()
+        )
         return (
             jsonify(
                 {
                     "result": True,
-                    "user": {
-                        "id": user.id,
-                        "name": user.name,
-                        "followers": followers_users,
-                        "following": following_users,
-                    },
+                    "users": [
+                        {"id": user_id, "name": name, "score": score}
+                        for score, user_id, name in suggestions
+                    ],
                 }
             ),
             200,
         )
 
-    @app.route("/api/users/<int:user_id>", methods=["GET"])
-    def get_user_profile(user_id: int) -> Tuple[Response, int]:
+    @app.route("/api/users/me/export", methods=["GET"])
+    @read_only
+    def export_my_data() -> Tuple[Response, int]:
         """
-        Получить информацию о профиле по ID
+        Выгрузить свои твиты, лайки и подписки в формате NDJSON
         """
         api_key = request.headers.get("api-key")
         user = authenticate_user(api_key)
@@ -419,32 +691,44 @@ def create_app(test_config=None) -> Flask:
         if isinstance(user, tuple):
             return user
 
-        user_data = db.session.query(User).filter_by(id=user_id).one_or_none()
+        return (
+            Response(
+                stream_with_context(iter_chunks(iter_user_export(user))),
+                mimetype="application/x-ndjson",
+                headers={
+                    "Content-Disposition": (
+                        f"attachment; filename=user_{user.id}.ndjson"
+                    ),
+                    "X-Accel-Buffering": "no",
+                },
+            ),
+            200,
+        )
 
-        followers = [
-            f.follower_id
-            for f in db.session.query(Follow).filter_by(followed_id=user_id).all()
-        ]
-        following = [
-            f.followed_id
-            for f in db.session.query(Follow).filter_by(follower_id=user_id).all()
-        ]
+    @app.route("/api/users/<int:user_id>/summary", methods=["GET"])
+    @read_only
+    def get_user_summary(user_id: int) -> Tuple[Response, int]:
+        """
+        Получить счётчики подписчиков, подписок, твитов и лайков пользователя
+        """
+        api_key = request.headers.get("api-key")
+        user = authenticate_user(api_key)
 
-        if not followers:
-            followers_users = []
-        else:
-            followers_users = [
-                user.to_json()
-                for user in db.session.query(User).filter(User.id.in_(followers)).all()
-            ]
+        if isinstance(user, tuple):
+            return user
 
-        if not following:
-            following_users = []
-        else:
-            following_users = [
-                user.to_json()
-                for user in db.session.query(User).filter(User.id.in_(following)).all()
-            ]
+        user_data = db.session.get(User, user_id)
+        if not user_data:
+            return (
+                jsonify(
+                    {
+                        "result": False,
+                        "error_type": "NotFound",
+                        "error_message": "User not found.",
+                    }
+                ),
+                400,
+            )
 
         return (
             jsonify(
@@ -453,12 +737,51 @@ def create_app(test_config=None) -> Flask:
                     "user": {
                         "id": user_data.id,
                         "name": user_data.name,
-                        "followers": followers_users,
-                        "following": following_users,
+                        "followers_count": user_data.followers_count,
+                        "following_count": user_data.following_count,
+                        "tweets_count": user_data.tweets_count,
+                        "likes_received_count": user_data.likes_received_count,
                     },
                 }
             ),
             200,
         )
 
+    @app.route("/api/users/<int:user_id>", methods=["GET"])
+    @read_only
+    def get_user_profile(user_id: int) -> Tuple[Response, int]:
+        """
+        Получить информацию о профиле по ID
+        """
+        api_key = request.headers.get("api-key")
+        user = authenticate_user(api_key)
+
+        if isinstance(user, tuple):
+            return user
+
+        fields = parse_fieldset(request.args.get("fields"), PROFILE_FIELDS)
+        if isinstance(fields, tuple):
+            return fields
+        include = parse_fieldset(request.args.get("include"), PROFILE_INCLUDES)
+        if isinstance(include, tuple):
+            return include
+
+        user_data = db.session.get(User, user_id)
+        if not user_data:
+            return (
+                jsonify(
+                    {
+                        "result": False,
+                        "error_type": "NotFound",
+                        "error_message": "User not found.",
+                    }
+                ),
+                400,
+            )
+
+        return (
+            jsonify({"result": True, "user": user_profile(user_data, fields, include)}),
+            200,
+        )
+
     return app
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from api.events import METRICS_TOPIC, EventBus  # type: ignore
+
+
+class Metrics:
+    """
+    Счётчики процесса (воркера gunicorn), доступные через /api/metrics.
+
+    Через шину событий воркеры раз в publish_interval секунд рассылают
+    свои счётчики, поэтому любой воркер может отдать сумму по всем процессам.
+    Счётчики процесса, от которого три интервала не было вестей (например,
+    перезапущенного воркера), в сумму больше не входят
+    """
+
+    def __init__(
+        self, bus: Optional[EventBus] = None, publish_interval: float = 5
+    ) -> None:
+        self.bus = bus
+        self.publish_interval = publish_interval
+        self._counters: Counter = Counter()
+        self._workers: Dict[int, Tuple[float, Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+        self._listener_pid: Optional[int] = None
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def aggregate(self) -> Tuple[Dict[str, int], List[int]]:
+        """
+        Сумма счётчиков всех процессов и список их pid
+        """
+        pid = os.getpid()
+        expired = time.monotonic() - 3 * self.publish_interval
+        with self._lock:
+            total = Counter(self._counters)
+            for worker_pid, (received, counters) in list(self._workers.items()):
+                if received < expired:
+                    del self._workers[worker_pid]
+                elif worker_pid != pid:
+                    total.update(counters)
+            pids = sorted({pid, *self._workers})
+        return dict(sorted(total.items())), pids
+
+    def listen(self) -> None:
+        """
+        Рассылать счётчики процесса и получать счётчики остальных воркеров
+        """
+        pid = os.getpid()
+        if self.bus is None or self._listener_pid == pid:
+            return
+        self._listener_pid = pid
+        bus = self.bus
+
+        def exchange() -> None:
+            published = 0.0
+            for event in bus.listen([METRICS_TOPIC], timeout=self.publish_interval):
+                now = time.monotonic()
+                if event is not None and event["data"]["pid"] != pid:
+                    with self._lock:
+                        self._workers[event["data"]["pid"]] = (
+                            now,
+                            event["data"]["metrics"],
+                        )
+                if now - published >= self.publish_interval:
+                    published = now
+                    bus.send(
+                        METRICS_TOPIC,
+                        "metrics",
+                        {"pid": pid, "metrics": self.snapshot()},
+                    )
+
+        threading.Thread(target=exchange, name="metrics-exchange", daemon=True).start()
@@ -0,0 +1,171 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+from db.models import Follow, Suggestion, User, db  # type: ignore
+from scipy import sparse
+from sqlalchemy import delete, func, insert, select
+
+SUGGESTIONS_TOP_N = 20
+SUGGESTIONS_CHUNK_SIZE = 10000
+# Вес пользователя, который уже подписан на нас, относительно одного общего знакомого
+FOLLOWS_YOU_WEIGHT = 2.0
+EDGES_BATCH_SIZE = 100000
+
+# Матрица подписок в процессе-воркере пула, передаётся один раз при его запуске
+_graph: Optional[sparse.csr_matrix] = None
+_graph_t: Optional[sparse.csr_matrix] = None
+
+
+def load_follow_graph(batch_size: int = EDGES_BATCH_SIZE) -> sparse.csr_matrix:
+    """
+    Разреженная матрица подписок A: A[i, j] = 1, если i подписан на j.
+    Рёбра читаются серверным курсором пачками. Пользователи и подписки,
+    добавленные после выбора размера матрицы, попадут в следующий запуск
+    """
+    size = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    result = db.session.execute(
+        select(Follow.follower_id, Follow.followed_id)
+        .where(Follow.follower_id < size, Follow.followed_id < size)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    batches = [
+        np.asarray(partition, dtype=np.int32).reshape(-1, 2)
+        for partition in result.partitions()
+    ]
+    edges = np.concatenate(batches) if batches else np.empty((0, 2), dtype=np.int32)
+
+    data = np.ones(len(edges), dtype=np.float32)
+    return sparse.csr_matrix((data, (edges[:, 0], edges[:, 1])), shape=(size, size))
+
+
+def score_chunk(
+    graph: sparse.csr_matrix, graph_t: sparse.csr_matrix, start: int, stop: int
+) -> sparse.csr_matrix:
+    """
+    Оценки кандидатов для пользователей start..stop-1:
+    число общих знакомых (друзья друзей) плюс FOLLOWS_YOU_WEIGHT,
+    если кандидат подписан на пользователя, а тот на него ещё нет.
+    Уже отслеживаемые пользователи и сам пользователь исключаются
+    """
+    follows = graph[start:stop]
+    scores = follows @ graph + FOLLOWS_YOU_WEIGHT * graph_t[start:stop]
+    scores = scores.tocsr()
+    scores = scores - scores.multiply(follows > 0)
+    self_mask = sparse.csr_matrix(
+        (np.ones(stop - start), (np.arange(stop - start), np.arange(start, stop))),
+        shape=scores.shape,
+    )
+    scores = scores - scores.multiply(self_mask)
+    scores.eliminate_zeros()
+    return scores
+
+
+def top_candidates(
+    scores: sparse.csr_matrix, start: int, top_n: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Лучшие top_n кандидатов каждой строки в виде массивов
+    (user_id, rank, candidate_id, score).
+    Все строки пачки сортируются одной сортировкой
+    """
+    scores.sort_indices()
+    counts = np.diff(scores.indptr)
+    rows = np.repeat(np.arange(scores.shape[0]), counts)
+    # Ключ «строка, затем убывание оценки»: span больше разброса оценок,
+    # поэтому строки не перемешиваются. Устойчивая сортировка оставляет
+    # кандидатов с равной оценкой по возрастанию id, как в строке CSR.
+    # Строки CSR уже идут подряд, поэтому каждая остаётся на своих позициях
+    span = np.ptp(scores.data) + 1 if scores.nnz else 1
+    order = np.argsort(rows * span - scores.data.astype(np.float64), kind="stable")
+    ranks = np.arange(1, len(order) + 1) - np.repeat(scores.indptr[:-1], counts)
+    keep = ranks <= top_n
+    return (
+        start + rows[keep],
+        ranks[keep],
+        scores.indices[order][keep],
+        scores.data[order][keep],
+    )
+
+
+def _init_worker(graph: sparse.csr_matrix) -> None:
+    global _graph, _graph_t
+    _graph = graph
+    _graph_t = graph.T.tocsr()
+
+
+def _compute_chunk(start: int, stop: int, top_n: int) -> Tuple[int, int, tuple]:
+    scores = score_chunk(_graph, _graph_t, start, stop)  # type: ignore
+    return start, stop, top_candidates(scores, start, top_n)
+
+
+def _chunks(size: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    for start in range(1, size, chunk_size):
+        yield start, min(start + chunk_size, size)
+
+
+def _iter_results(
+    graph: sparse.csr_matrix, chunk_size: int, top_n: int, workers: int
+) -> Iterator[Tuple[int, int, tuple]]:
+    """
+    Результаты по пачкам пользователей. Одновременно в работе не больше
+    2 * workers пачек, чтобы память не росла, если запись в БД отстаёт
+    """
+    size = graph.shape[0]
+    if workers <= 1:
+        _init_worker(graph)
+        for start, stop in _chunks(size, chunk_size):
+            yield _compute_chunk(start, stop, top_n)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(graph,)
+    ) as executor:
+        pending: Deque[Future] = deque()
+        for start, stop in _chunks(size, chunk_size):
+            pending.append(executor.submit(_compute_chunk, start, stop, top_n))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def compute_suggestions(
+    top_n: int = SUGGESTIONS_TOP_N,
+    chunk_size: int = SUGGESTIONS_CHUNK_SIZE,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Пересчитать рекомендации «на кого подписаться» для всех пользователей.
+    Рекомендации каждой пачки пользователей заменяются в отдельной транзакции.
+    Возвращает количество сохранённых рекомендаций
+    """
+    workers = workers or os.cpu_count() or 1
+    graph = load_follow_graph()
+    db.session.commit()
+
+    saved = 0
+    for start, stop, (user_ids, ranks, candidate_ids, scores) in _iter_results(
+        graph, chunk_size, top_n, workers
+    ):
+        db.session.execute(
+            delete(Suggestion).where(Suggestion.user_id.between(start, stop - 1))
+        )
+        rows: List[dict] = [
+            {
+                "user_id": int(user_id),
+                "rank": int(rank),
+                "candidate_id": int(candidate_id),
+                "score": float(score),
+            }
+            for user_id, rank, candidate_id, score in zip(
+                user_ids, ranks, candidate_ids, scores
+            )
+        ]
+        if rows:
+            db.session.execute(insert(Suggestion), rows)
+        db.session.commit()
+        saved += len(rows)
+    return saved
@@ -0,0 +1,239 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api.events import TRENDING_TOPIC, EventBus  # type: ignore
+
+
+class TrendingTweets:
+    """
+    Топ-k твитов по числу лайков за скользящее окно.
+
+    Окно делится на buckets корзин по window / buckets секунд; каждая корзина
+    хранит прирост лайков по твитам. Суммы по окну и отсортированный топ
+    обновляются при каждом лайке, поэтому чтение топа занимает O(k).
+    Полный пересчёт топа (O(n log k)) нужен только при выходе корзины
+    из окна или при снятии лайка с твита из топа
+    """
+
+    def __init__(
+        self,
+        window: int = 3600,
+        buckets: int = 60,
+        top_k: int = 100,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: int = 60,
+        bus: Optional[EventBus] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.bucket_seconds = max(window // buckets, 1)
+        self.buckets = buckets
+        self.top_k = top_k
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.bus = bus
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, Counter] = {}
+        self._totals: Counter = Counter()
+        self._top: List[Tuple[int, int]] = []
+        self._last_checkpoint = clock()
+        self._dirty = False
+        self._listener_pid: Optional[int] = None
+        if checkpoint_path:
+            self._load()
+
+    def record(self, tweet_id: int, delta: int) -> None:
+        """
+        Учесть лайк (delta=1) или снятие лайка (delta=-1)
+        и сообщить о нём остальным воркерам
+        """
+        self._apply(tweet_id, delta)
+        if self.bus is not None:
+            self.bus.send(
+                TRENDING_TOPIC,
+                "like",
+                {"tweet_id": tweet_id, "delta": delta, "pid": os.getpid()},
+            )
+
+    def top(self, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Список пар (tweet_id, число лайков за окно) по убыванию популярности
+        """
+        with self._lock:
+            self._advance(self._clock())
+            return [(tweet_id, score) for score, tweet_id in self._top[:limit]]
+
+    def discard(self, tweet_id: int) -> None:
+        """
+        Убрать удалённый твит из окна и сообщить об этом остальным воркерам
+        """
+        self._discard(tweet_id)
+        if self.bus is not None:
+            self.bus.send(
+                TRENDING_TOPIC, "discard", {"tweet_id": tweet_id, "pid": os.getpid()}
+            )
+
+    def clear(self) -> None:
+        """
+        Очистить окно
+        """
+        with self._lock:
+            self._buckets.clear()
+            self._totals.clear()
+            self._top = []
+            self._dirty = True
+
+    def reload(self) -> None:
+        """
+        Заменить окно данными контрольной точки. Нужно воркеру, которого gunicorn
+        перезапустил: при preload_app он наследует окно мастера на момент запуска
+        """
+        with self._lock:
+            self._buckets.clear()
+            self._totals.clear()
+            self._top = []
+            self._dirty = False
+            if self.checkpoint_path:
+                self._load()
+
+    def checkpoint(self) -> None:
+        """
+        Сохранить корзины окна на диск, чтобы топ пережил перезапуск.
+        Процесс без новых лайков (например, мастер gunicorn) файл не перезаписывает
+        """
+        self._last_checkpoint = self._clock()
+        if not self.checkpoint_path or not self._dirty:
+            return
+        with self._lock:
+            self._dirty = False
+            state = {
+                "bucket_seconds": self.bucket_seconds,
+                "buckets": {
+                    str(index): {str(k): v for k, v in bucket.items()}
+                    for index, bucket in self._buckets.items()
+                },
+            }
+        tmp_path = "{}.{}.{}.tmp".format(
+            self.checkpoint_path, os.getpid(), threading.get_ident()
+        )
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def listen(self) -> None:
+        """
+        Учитывать лайки, поставленные в других воркерах gunicorn.
+        Лайки своего процесса учитываются сразу в record
+        """
+        pid = os.getpid()
+        if self.bus is None or self._listener_pid == pid:
+            return
+        self._listener_pid = pid
+        bus = self.bus
+
+        def consume() -> None:
+            for event in bus.listen([TRENDING_TOPIC], timeout=60):
+                if event is None or event["data"]["pid"] == pid:
+                    continue
+                if event["event"] == "discard":
+                    self._discard(event["data"]["tweet_id"])
+                else:
+                    self._apply(event["data"]["tweet_id"], event["data"]["delta"])
+
+        threading.Thread(target=consume, name="trending-listener", daemon=True).start()
+
+    def _apply(self, tweet_id: int, delta: int) -> None:
+        now = self._clock()
+        with self._lock:
+            self._advance(now)
+            bucket = self._buckets.setdefault(self._bucket_index(now), Counter())
+            bucket[tweet_id] += delta
+            if not bucket[tweet_id]:
+                del bucket[tweet_id]
+            self._totals[tweet_id] += delta
+            if not self._totals[tweet_id]:
+                del self._totals[tweet_id]
+            self._update_top(tweet_id, delta)
+            self._dirty = True
+        if now - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def _discard(self, tweet_id: int) -> None:
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.pop(tweet_id, None)
+            self._totals.pop(tweet_id, None)
+            if any(entry[1] == tweet_id for entry in self._top):
+                # Освободившееся место займёт следующий по популярности твит
+                self._rebuild_top()
+            self._dirty = True
+
+    def _bucket_index(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+
+    def _advance(self, now: float) -> None:
+        oldest = self._bucket_index(now) - self.buckets + 1
+        expired = [index for index in self._buckets if index < oldest]
+        if not expired:
+            return
+        for index in expired:
+            self._totals.subtract(self._buckets.pop(index))
+        self._drop_zero_totals()
+        self._rebuild_top()
+
+    def _drop_zero_totals(self) -> None:
+        # Отрицательные суммы не отбрасываются: это снятые лайки, поставленные
+        # до начала окна, и они должны погаситься будущими лайками
+        for tweet_id in [k for k, v in self._totals.items() if not v]:
+            del self._totals[tweet_id]
+
+    def _rebuild_top(self) -> None:
+        self._top = heapq.nlargest(
+            self.top_k,
+            (
+                (score, tweet_id)
+                for tweet_id, score in self._totals.items()
+                if score > 0
+            ),
+        )
+
+    def _update_top(self, tweet_id: int, delta: int) -> None:
+        entry = next((e for e in self._top if e[1] == tweet_id), None)
+        if entry is not None:
+            self._top.remove(entry)
+            if delta < 0 and len(self._top) + 1 >= self.top_k:
+                # Место в топе мог занять твит, которого сейчас в топе нет
+                self._rebuild_top()
+                return
+        score = self._totals.get(tweet_id, 0)
+        if score <= 0:
+            return
+        new_entry = (score, tweet_id)
+        if len(self._top) >= self.top_k and new_entry < self._top[-1]:
+            return
+        position = next(
+            (i for i, e in enumerate(self._top) if e < new_entry), len(self._top)
+        )
+        self._top.insert(position, new_entry)
+        del self._top[self.top_k :]
+
+    def _load(self) -> None:
+        try:
+            with open(self.checkpoint_path) as file:  # type: ignore
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        if state.get("bucket_seconds") != self.bucket_seconds:
+            return
+        for index, bucket in state["buckets"].items():
+            counts = Counter({int(k): v for k, v in bucket.items()})
+            self._buckets[int(index)] = counts
+            self._totals.update(counts)
+        self._drop_zero_totals()
+        self._rebuild_top()
+        self._advance(self._clock())
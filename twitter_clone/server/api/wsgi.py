@@ -1,9 +1,15 @@
+from api.counters import migrate_counters  # type: ignore
+from api.events import start_proxy  # type: ignore
 from api.main import create_app  # type: ignore
 from db.models import db  # type: ignore
 
 app = create_app()
 with app.app_context():
     db.create_all()
+    migrate_counters()
 
 if __name__ == "__main__":
+    start_proxy(app.config["EVENTS_PUB_ADDR"], app.config["EVENTS_SUB_ADDR"])
+    app.extensions["trending"].listen()
+    app.extensions["metrics"].listen()
     app.run(host="0.0.0.0", port=5000, debug=True)
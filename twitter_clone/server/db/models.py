@@ -1,8 +1,11 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Set
 
+from db.routing import RoutingSession  # type: ignore
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+USER_PRIVATE_FIELDS = {"api_key"}
 
 
 class User(db.Model):
@@ -10,6 +13,18 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(50), nullable=False)
     api_key = db.Column(db.String(50), unique=True, nullable=False)
+    # Счётчики поддерживаются обработчиками API в той же транзакции,
+    # что и изменения, и периодически сверяются командой reconcile-counters
+    followers_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    following_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    tweets_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    likes_received_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
 
     def __repr__(self) -> str:
         return f"User {self.name}"
@@ -17,6 +32,17 @@ class User(db.Model):
     def to_json(self) -> Dict[str, Any]:
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
+    def to_public_json(self) -> Dict[str, Any]:
+        """
+        Данные пользователя, которые можно показывать другим пользователям
+        и отдавать наружу: без api-ключа
+        """
+        return {
+            c.name: getattr(self, c.name)
+            for c in self.__table__.columns
+            if c.name not in USER_PRIVATE_FIELDS
+        }
+
 
 class Tweet(db.Model):
     __tablename__ = "tweets"
@@ -36,11 +62,22 @@ class Tweet(db.Model):
     def __repr__(self) -> str:
         return f"Tweet {self.content} author {self.author}"
 
-    def to_json(self) -> Dict[str, Any]:
-        data_tweet = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        data_tweet["author"] = self.author.to_json() if self.author else None
-        data_tweet["likes"] = [like.to_json() for like in self.likes]
-        data_tweet["medias"] = [media.to_json() for media in self.medias]
+    def to_json(
+        self, fields: Optional[Set[str]] = None, include: Optional[Set[str]] = None
+    ) -> Dict[str, Any]:
+        data_tweet = {
+            c.name: getattr(self, c.name)
+            for c in self.__table__.columns
+            if fields is None or c.name in fields
+        }
+        if include is None or "author" in include:
+            data_tweet["author"] = (
+                self.author.to_public_json() if self.author else None
+            )
+        if include is None or "likes" in include:
+            data_tweet["likes"] = [like.to_json() for like in self.likes]
+        if include is None or "medias" in include:
+            data_tweet["medias"] = [media.to_json() for media in self.medias]
         return data_tweet
 
 
@@ -81,3 +118,17 @@ class Follow(db.Model):
 
     def to_json(self) -> Dict[str, Any]:
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class Suggestion(db.Model):
+    __tablename__ = "suggestions"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"Suggestion {self.candidate_id} for User {self.user_id}"
+
+    def to_json(self) -> Dict[str, Any]:
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
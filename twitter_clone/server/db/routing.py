@@ -0,0 +1,126 @@
+import math
+import random
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import Request, Response, current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import OperationalError
+
+REPLICA_BIND_PREFIX = "replica_"
+
+
+def replica_binds(uris: Any) -> Dict[str, str]:
+    """
+    Ключи SQLALCHEMY_BINDS для адресов реплик
+    """
+    return {f"{REPLICA_BIND_PREFIX}{i}": uri for i, uri in enumerate(uris)}
+
+
+class ReplicaHealth:
+    """
+    Реплики, к которым не удалось подключиться. Такая реплика пропускается
+    retry_seconds секунд, а чтение в это время идёт в другие реплики
+    или в основную базу
+    """
+
+    def __init__(self, retry_seconds: float) -> None:
+        self.retry_seconds = retry_seconds
+        self._retry_at: Dict[str, float] = {}
+
+    def is_available(self, key: str) -> bool:
+        return self._retry_at.get(key, 0) <= time.monotonic()
+
+    def mark_unavailable(self, key: str) -> None:
+        self._retry_at[key] = time.monotonic() + self.retry_seconds
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая отправляет чтение в одну из реплик,
+    если обработчик помечен декоратором read_only.
+    Запись (flush) всегда идёт в основную базу, туда же идёт чтение,
+    если ни одна реплика не доступна
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):  # type: ignore
+        if bind is None and self.info.get("read_only") and not self._flushing:
+            replica = self._replica()
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self) -> Optional[str]:
+        if "replica" not in self.info:
+            # Одна реплика на всю сессию, чтобы запросы видели один снимок данных
+            keys = [
+                key
+                for key in self._db.engines
+                if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)
+            ]
+            random.shuffle(keys)
+            self.info["replica"] = next(
+                (key for key in keys if self._is_reachable(key)), None
+            )
+        return self.info["replica"]
+
+    def _is_reachable(self, key: str) -> bool:
+        health = current_app.extensions.get("replica_health")
+        if health is not None and not health.is_available(key):
+            return False
+        try:
+            with self._db.engines[key].connect():
+                pass
+        except OperationalError:
+            current_app.logger.warning("Реплика %s недоступна", key, exc_info=True)
+            if health is not None:
+                health.mark_unavailable(key)
+            return False
+        return True
+
+
+class StickyPrimary:
+    """
+    Пользователь, который только что что-то изменил, ещё sticky_seconds секунд
+    читает из основной базы, чтобы сразу видеть свои изменения несмотря
+    на отставание реплик. Срок хранится в cookie клиента, а не в памяти процесса,
+    поэтому его видят все воркеры gunicorn
+    """
+
+    cookie_name = "read_primary_until"
+
+    def __init__(self, sticky_seconds: float) -> None:
+        self.sticky_seconds = sticky_seconds
+
+    def mark(self, response: Response) -> None:
+        until = time.time() + self.sticky_seconds
+        response.set_cookie(
+            self.cookie_name,
+            f"{until:.3f}",
+            max_age=math.ceil(self.sticky_seconds),
+            httponly=True,
+            samesite="Lax",
+        )
+
+    def is_sticky(self, request: Request) -> bool:
+        try:
+            return float(request.cookies.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+def read_only(view: Callable) -> Callable:
+    """
+    Декоратор обработчика, который только читает данные:
+    запросы такого обработчика идут в реплики
+    """
+
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        sticky = current_app.extensions.get("sticky_primary")
+        if sticky is None or not sticky.is_sticky(request):
+            current_app.extensions["sqlalchemy"].session.info["read_only"] = True
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,42 @@
+import os
+
+from api.events import EVENTS_PUB_BIND, EVENTS_SUB_BIND, start_proxy  # type: ignore
+
+# Основной сервер API. Долгоживущие SSE-соединения /api/tweets/stream
+# обслуживает отдельный сервер (gunicorn.stream.conf.py), чтобы они
+# не занимали потоки обычных запросов
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+
+# Пул соединений каждого воркера по числу потоков: всего не больше
+# workers * threads соединений с основной базой и с каждой репликой
+os.environ.setdefault("SQLALCHEMY_POOL_SIZE", str(threads))
+os.environ.setdefault("SQLALCHEMY_MAX_OVERFLOW", "0")
+
+
+def when_ready(server) -> None:
+    """
+    Запустить в мастер-процессе шину событий, через которую воркеры
+    обмениваются событиями для SSE
+    """
+    start_proxy(EVENTS_PUB_BIND, EVENTS_SUB_BIND)
+
+
+def post_fork(server, worker) -> None:
+    """
+    Не использовать в воркерах соединения с БД, открытые мастером
+    при загрузке приложения, загрузить топ популярных твитов из последней
+    контрольной точки и подписать воркер на лайки и счётчики остальных воркеров
+    """
+    from api.wsgi import app  # type: ignore
+    from db.models import db  # type: ignore
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    trending = app.extensions["trending"]
+    trending.reload()
+    trending.listen()
+    app.extensions["metrics"].listen()
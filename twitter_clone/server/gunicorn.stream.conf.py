@@ -0,0 +1,26 @@
+import os
+
+# Сервер потоков server-sent events /api/tweets/stream. Каждое соединение
+# занимает поток на всё время жизни, но почти всё время ждёт событий шины,
+# поэтому потоков много, а соединение с БД нужно только при подключении
+workers = int(os.environ.get("STREAM_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("STREAM_THREADS", 200))
+preload_app = True
+
+os.environ.setdefault("SQLALCHEMY_POOL_SIZE", "5")
+os.environ.setdefault("SQLALCHEMY_MAX_OVERFLOW", "0")
+
+
+def post_fork(server, worker) -> None:
+    """
+    Не использовать в воркерах соединения с БД, открытые мастером
+    при загрузке приложения, и рассылать счётчики воркера для /api/metrics
+    """
+    from api.wsgi import app  # type: ignore
+    from db.models import db  # type: ignore
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    app.extensions["metrics"].listen()
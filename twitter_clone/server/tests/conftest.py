@@ -1,62 +1,217 @@
+import hashlib
+import inspect
 import os
 
 import pytest
+import zmq
+from api.events import start_proxy  # type: ignore
 from api.main import create_app  # type: ignore
 from db.models import Follow, Like, Tweet, User  # type: ignore
 from db.models import db as _db  # type: ignore
-from flask import Flask
+from flask import Flask, request_tearing_down
 from flask.testing import FlaskClient
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
 
+DATABASE_SERVER_URI = "postgresql+psycopg2://admin:admin@db:5432"
+TEMPLATE_DATABASE = "twitter_test_template"
+# Ключ advisory-блокировки, под которой воркеры xdist по очереди создают свои базы
+TEMPLATE_LOCK_ID = 20250801
 
-@pytest.fixture()
-def app() -> Flask:
+
+def database_uri(name: str) -> str:
+    return f"{DATABASE_SERVER_URI}/{name}"
+
+
+def replica_uri(name: str) -> str:
+    """
+    Вместо реплики — отдельное подключение к той же базе в режиме только для чтения:
+    запись, ошибочно отправленная в реплику, завершится ошибкой. Как и отстающая
+    реплика, оно не видит незафиксированных изменений транзакции теста
+    """
+    return f"{database_uri(name)}?options=-c%20default_transaction_read_only%3Don"
+
+
+def seed_database() -> None:
+    """
+    Тестовые данные шаблонной базы. Объёмные наборы данных тоже добавляются
+    здесь: они создаются один раз и копируются в базы воркеров из шаблона
+    """
+    _db.session.add_all(
+        [
+            User(
+                name="Test User",
+                api_key="test-api-key",
+                following_count=1,
+                tweets_count=1,
+            ),
+            User(
+                name="Test User_2",
+                api_key="api-key_2",
+                followers_count=1,
+                tweets_count=1,
+                likes_received_count=1,
+            ),
+            User(name="Test User_3", api_key="api-key_3"),
+        ]
+    )
+    _db.session.flush()
+    _db.session.add_all(
+        [
+            Tweet(user_id=1, content="Hello!", medias_ids=[], count_likes=0),
+            Tweet(user_id=2, content="Hello, Friends!", medias_ids=[], count_likes=1),
+        ]
+    )
+    _db.session.flush()
+    _db.session.add_all(
+        [
+            Like(user_id=1, tweet_id=2),
+            Follow(follower_id=1, followed_id=2),
+        ]
+    )
+    _db.session.commit()
+
+
+def template_signature() -> str:
+    """
+    Хэш схемы и тестовых данных: шаблон пересоздаётся, только если они изменились
+    """
+    ddl = [
+        str(CreateTable(table).compile(dialect=postgresql.dialect()))
+        for table in _db.metadata.sorted_tables
+    ]
+    source = "".join(ddl) + inspect.getsource(seed_database)
+    return hashlib.md5(source.encode()).hexdigest()
+
+
+def build_template(admin: Connection) -> None:
+    """
+    Создать шаблонную базу со схемой и тестовыми данными, если её ещё нет
+    или она устарела
+    """
+    signature = template_signature()
+    current = admin.execute(
+        text(
+            "SELECT shobj_description(oid, 'pg_database') "
+            "FROM pg_database WHERE datname = :name"
+        ),
+        {"name": TEMPLATE_DATABASE},
+    ).scalar()
+    if current == signature:
+        return
+
+    admin.execute(text(f"DROP DATABASE IF EXISTS {TEMPLATE_DATABASE} WITH (FORCE)"))
+    admin.execute(text(f"CREATE DATABASE {TEMPLATE_DATABASE}"))
+    template_app = create_app(
+        {"TESTING": True, "SQLALCHEMY_DATABASE_URI": database_uri(TEMPLATE_DATABASE)}
+    )
+    with template_app.app_context():
+        _db.create_all()
+        seed_database()
+        _db.session.remove()
+        for engine in _db.engines.values():
+            engine.dispose()
+    admin.execute(text(f"COMMENT ON DATABASE {TEMPLATE_DATABASE} IS '{signature}'"))
+
+
+@pytest.fixture(scope="session")
+def database_name() -> str:
+    """
+    Фикстура отдельной тестовой базы для каждого воркера pytest-xdist,
+    скопированной из шаблонной базы
+    """
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    name = f"twitter_test_{worker}" if worker else "twitter_test"
+    admin_engine = create_engine(database_uri("postgres"), isolation_level="AUTOCOMMIT")
+    with admin_engine.connect() as admin:
+        admin.execute(text("SELECT pg_advisory_lock(:id)"), {"id": TEMPLATE_LOCK_ID})
+        try:
+            build_template(admin)
+            admin.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+            admin.execute(text(f"CREATE DATABASE {name} TEMPLATE {TEMPLATE_DATABASE}"))
+        finally:
+            admin.execute(
+                text("SELECT pg_advisory_unlock(:id)"), {"id": TEMPLATE_LOCK_ID}
+            )
+    admin_engine.dispose()
+    yield name
+
+
+@pytest.fixture(scope="session")
+def app(database_name: str) -> Flask:
     """
     Фикстура экземпляра Flask-приложения для тестирования
     """
     test_config = {
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "postgresql+psycopg2://admin:admin@db:5432/twitter_test",
-        "UPLOAD_FOLDER": "tests/test_uploads"
+        "SQLALCHEMY_DATABASE_URI": database_uri(database_name),
+        "SQLALCHEMY_REPLICA_URIS": [replica_uri(database_name)],
+        "UPLOAD_FOLDER": "tests/test_uploads",
+        "EVENTS_PUB_ADDR": "inproc://events_in",
+        "EVENTS_SUB_ADDR": "inproc://events_out",
     }
     _app = create_app(test_config)
-
+    os.makedirs(_app.config["UPLOAD_FOLDER"], exist_ok=True)
+    yield _app
     with _app.app_context():
-        os.makedirs(_app.config["UPLOAD_FOLDER"], exist_ok=True)
-        _db.create_all()
+        for engine in _db.engines.values():
+            engine.dispose()
 
-        users_test = [
-            User(name="Test User", api_key="test-api-key"),
-            User(name="Test User_2", api_key="api-key_2"),
-            User(name="Test User_3", api_key="api-key_3"),
-        ]
-        for user_test in users_test:
-            if user_test not in _db.session.query(User).all():
-                _db.session.add(user_test)
-                _db.session.commit()
 
-        tweets_test = [
-            Tweet(user_id=1, content="Hello!", medias_ids=[], count_likes=0),
-            Tweet(user_id=2, content="Hello, Friends!", medias_ids=[], count_likes=1)
-        ]
-        _db.session.bulk_save_objects(tweets_test)
-        _db.session.commit()
+@pytest.fixture(scope="session")
+def event_proxy(app: Flask) -> None:
+    """
+    Фикстура шины событий приложения (адреса inproc, общий контекст ZeroMQ)
+    """
+    start_proxy(
+        app.config["EVENTS_PUB_ADDR"],
+        app.config["EVENTS_SUB_ADDR"],
+        zmq.Context.instance(),
+    )
+    yield
 
-        like = Like(user_id=1, tweet_id=2)
-        _db.session.add(like)
-        _db.session.commit()
 
-        follower = Follow(follower_id=1, followed_id=2)
-        _db.session.add(follower)
-        _db.session.commit()
+def remove_session(sender: Flask, **kwargs: object) -> None:
+    _db.session.remove()
 
-        yield _app
-        _db.session.close()
-        _db.drop_all()
+
+@pytest.fixture
+def transaction(app: Flask) -> Connection:
+    """
+    Фикстура транзакции теста: основная база подменяется соединением теста,
+    коммиты приложения превращаются в точки сохранения,
+    а вся транзакция откатывается после теста. Реплика остаётся настоящей
+    """
+    with app.app_context():
+        connection = _db.engine.connect()
+        outer_transaction = connection.begin()
+        engines = _db.engines
+        primary = engines[None]
+        engines[None] = connection  # type: ignore
+        _db.session.remove()
+        _db.session.configure(join_transaction_mode="create_savepoint")
+        # Контекст приложения теста общий для всех запросов, поэтому сессия,
+        # как и вне тестов, удаляется в конце каждого запроса
+        request_tearing_down.connect(remove_session, app)
+
+        yield connection
+
+        request_tearing_down.disconnect(remove_session, app)
+        _db.session.remove()
+        _db.session.configure(join_transaction_mode="conservative_savepoint")
+        engines[None] = primary  # type: ignore
+        outer_transaction.rollback()
+        connection.close()
+
+    # Состояние в памяти, как и данные в базе, не переходит в следующий тест
+    app.extensions["trending"].clear()
 
 
 @pytest.fixture
-def client(app: Flask) -> FlaskClient:
+def client(app: Flask, transaction: Connection) -> FlaskClient:
     """
     Фикстура тестового клиента для Flask-приложения
     """
@@ -65,12 +220,11 @@ def client(app: Flask) -> FlaskClient:
 
 
 @pytest.fixture
-def db(app: Flask) -> SQLAlchemy:
+def db(app: Flask, transaction: Connection) -> SQLAlchemy:
     """
     Фикстура тестовой базы данных
     """
-    with app.app_context():
-        yield _db
+    yield _db
 
 
 @pytest.fixture
@@ -1,10 +1,15 @@
+import gzip
+import json
 import os
 from typing import Any
 
+import brotli
 import pytest
+from api.counters import migrate_counters, reconcile_counters  # type: ignore
 from db.models import User  # type: ignore
 from faker import Faker
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
 from tests.factories import UserFactory  # type: ignore
 
 fake = Faker("en_US")
@@ -30,7 +35,9 @@ def test_download_files_from_tweet(client: Any, db: SQLAlchemy, headers: dict) -
     Тестирование загрузки файла из твита
     """
     file = open(os.path.join("tests/images", "Hello!.png"), "rb")
-    resp = client.post("/api/medias", data={"file": (file, "Hello!.png")}, headers=headers)
+    resp = client.post(
+        "/api/medias", data={"file": (file, "Hello!.png")}, headers=headers
+    )
 
     assert resp.status_code == 201
     assert resp.json["result"] is True
@@ -62,6 +69,138 @@ def test_route_status(client: Any, headers: dict, route: str) -> None:
     assert resp.json is not None
 
 
+def test_stream_tweets(client: Any, headers: dict) -> None:
+    """
+    Тестирование открытия потока server-sent events
+    """
+    resp = client.get("/api/tweets/stream", headers=headers, buffered=False)
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    assert next(resp.response) == b"retry: 3000\n\n"
+    resp.close()
+
+
+def test_stream_tweets_delivers_new_tweets(
+    app: Any, client: Any, event_proxy: None, monkeypatch: Any
+) -> None:
+    """
+    Тестирование доставки нового твита отслеживаемого пользователя в поток,
+    открытый с api-key в параметре запроса, как это делает EventSource
+    """
+    monkeypatch.setitem(app.config, "EVENTS_HEARTBEAT", 0.05)
+    resp = client.get("/api/tweets/stream?api_key=test-api-key", buffered=False)
+    assert next(resp.response) == b"retry: 3000\n\n"
+
+    # Подписка устанавливается асинхронно: публикуем, пока событие не дойдёт
+    chunk = b": ping\n\n"
+    for _ in range(50):
+        client.post(
+            "/api/tweets",
+            data={"tweet_data": "Live!", "tweet_media_ids": [1]},
+            headers={"api-key": "api-key_2"},
+        )
+        chunk = next(resp.response)
+        if chunk != b": ping\n\n":
+            break
+    resp.close()
+
+    assert chunk.startswith(b"event: tweet\ndata: ")
+    tweet = json.loads(chunk.split(b"data: ", 1)[1])
+    assert tweet["content"] == "Live!"
+    # Событие получают все подписчики автора: в нём нет api-ключа
+    assert tweet["author"]["name"] == "Test User_2"
+    assert "api_key" not in tweet["author"]
+
+
+def test_get_tweets_fieldset(client: Any, headers: dict) -> None:
+    """
+    Тестирование выбора полей твитов в ленте
+    """
+    resp = client.get(
+        "/api/tweets?fields=id,count_likes&include=author", headers=headers
+    )
+
+    assert resp.status_code == 200
+    assert resp.json["tweets"] == [
+        {"id": 2, "count_likes": 1, "author": resp.json["tweets"][0]["author"]}
+    ]
+    assert resp.json["tweets"][0]["author"]["name"] == "Test User_2"
+
+
+@pytest.mark.parametrize(
+    "query, tweet",
+    [
+        ("fields=&include=likes", {"likes": [{"id": 1, "tweet_id": 2, "user_id": 1}]}),
+        ("fields=&include=", {}),
+        ("fields=", None),
+    ],
+)
+def test_get_tweets_empty_fieldset(
+    client: Any, headers: dict, query: str, tweet: Any
+) -> None:
+    """
+    Тестирование ленты с пустым списком полей твита
+    """
+    resp = client.get(f"/api/tweets?{query}", headers=headers)
+
+    assert resp.status_code == 200
+    assert len(resp.json["tweets"]) == 1
+    if tweet is not None:
+        assert resp.json["tweets"][0] == tweet
+    else:
+        assert set(resp.json["tweets"][0]) == {"author", "likes", "medias"}
+
+
+@pytest.mark.parametrize("route", ["/api/users/me", "/api/users/1"])
+def test_get_profile_fieldset(client: Any, headers: dict, route: str) -> None:
+    """
+    Тестирование получения счётчиков профиля без списков подписчиков
+    """
+    resp = client.get(f"{route}?fields=id,following_count&include=", headers=headers)
+
+    assert resp.status_code == 200
+    assert resp.json["user"] == {"id": 1, "following_count": 1}
+
+
+def test_error_unknown_fieldset(client: Any, headers: dict) -> None:
+    """
+    Тестирование ошибки при запросе неизвестного поля
+    """
+    resp = client.get("/api/tweets?include=author,retweets", headers=headers)
+
+    assert resp.status_code == 400
+    assert resp.json == {
+        "result": False,
+        "error_type": "InvalidInput",
+        "error_message": "Unknown fields: retweets",
+    }
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_compressed_response(
+    app: Any, client: Any, headers: dict, monkeypatch: Any, encoding: str
+) -> None:
+    """
+    Тестирование сжатия ответа и учёта сэкономленных байт
+    """
+    monkeypatch.setitem(app.config, "COMPRESS_MIN_SIZE", 100)
+    before = client.get("/api/metrics").json["metrics"]
+    resp = client.get(
+        "/api/tweets", headers={**headers, "Accept-Encoding": f"{encoding}, identity"}
+    )
+
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == encoding
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    decompress = gzip.decompress if encoding == "gzip" else brotli.decompress
+    assert json.loads(decompress(resp.data))["result"] is True
+    after = client.get("/api/metrics").json["metrics"]
+    responses = f"compression.{encoding}.responses"
+    assert after[responses] - before.get(responses, 0) == 1
+    assert after["compression.bytes_saved"] > before.get("compression.bytes_saved", 0)
+
+
 def test_delete_tweet(client: Any, db: SQLAlchemy, headers: dict) -> None:
     """
     Тестирование удаления твита
@@ -96,6 +235,55 @@ def test_add_likes_tweet(client: Any, db: SQLAlchemy, headers: dict) -> None:
     assert resp.json == {"result": True}
 
 
+def test_get_trending_tweets(client: Any, db: SQLAlchemy, headers: dict) -> None:
+    """
+    Тестирование получения популярных твитов
+    """
+    client.post("/api/tweets/2/likes", headers=headers)
+    resp = client.get("/api/tweets/trending", headers=headers)
+
+    assert resp.status_code == 200
+    assert [t["id"] for t in resp.json["tweets"]] == [2]
+    assert resp.json["tweets"][0]["trending_likes"] == 1
+
+
+def test_get_trending_tweets_payload(client: Any) -> None:
+    """
+    Тестирование состава популярных твитов: автор без api-ключа,
+    списки лайков — только по запросу include
+    """
+    client.post("/api/tweets/2/likes", headers={"api-key": "api-key_3"})
+
+    resp = client.get("/api/tweets/trending", headers={"api-key": "api-key_3"})
+    tweet = resp.json["tweets"][0]
+    assert tweet["author"]["name"] == "Test User_2"
+    assert "api_key" not in tweet["author"]
+    assert "likes" not in tweet
+
+    resp = client.get(
+        "/api/tweets/trending?fields=id&include=likes",
+        headers={"api-key": "api-key_3"},
+    )
+    assert resp.json["tweets"] == [
+        {"id": 2, "likes": resp.json["tweets"][0]["likes"], "trending_likes": 1}
+    ]
+    assert len(resp.json["tweets"][0]["likes"]) == 2
+
+
+def test_delete_trending_tweet(client: Any, headers: dict) -> None:
+    """
+    Тестирование удаления твита из популярных: его место занимает следующий
+    """
+    client.post("/api/tweets/1/likes", headers={"api-key": "api-key_2"})
+    client.post("/api/tweets/1/likes", headers={"api-key": "api-key_3"})
+    client.post("/api/tweets/2/likes", headers={"api-key": "api-key_3"})
+
+    client.delete("/api/tweets/1", headers=headers)
+    resp = client.get("/api/tweets/trending?limit=1", headers=headers)
+
+    assert [t["id"] for t in resp.json["tweets"]] == [2]
+
+
 def test_error_add_likes_tweet(client: Any, headers: dict) -> None:
     """
     Тестирование ошибки при добавлении лайка несуществующему твиту
@@ -138,7 +326,7 @@ def test_add_follow(client: Any, db: SQLAlchemy, headers: dict) -> None:
     """
     Тестирование подписки на другого пользователя
     """
-    resp = client.post(f"/api/users/3/follow", headers=headers)
+    resp = client.post("/api/users/3/follow", headers=headers)
 
     assert resp.status_code == 201
     assert resp.json == {"result": True}
@@ -148,13 +336,13 @@ def test_error_add_follow(client: Any, db: SQLAlchemy, headers: dict) -> None:
     """
     Тестирование ошибки подписки на самого себя
     """
-    resp = client.post(f"/api/users/1/follow", headers=headers)
+    resp = client.post("/api/users/1/follow", headers=headers)
 
     assert resp.status_code == 400
     assert resp.json == {
         "result": False,
         "error_type": "FollowError",
-        "error_message": "You can't follow to yourself."
+        "error_message": "You can't follow to yourself.",
     }
 
 
@@ -162,7 +350,7 @@ def test_delete_follow(client: Any, db: SQLAlchemy, headers: dict) -> None:
     """
     Тестирование отписки от пользователя
     """
-    resp = client.delete(f"/api/users/2/follow", headers=headers)
+    resp = client.delete("/api/users/2/follow", headers=headers)
 
     assert resp.status_code == 201
     assert resp.json == {"result": True}
@@ -182,6 +370,151 @@ def test_error_delete_follow(client: Any, headers: dict) -> None:
     }
 
 
+def test_export_my_data(client: Any, headers: dict) -> None:
+    """
+    Тестирование потоковой выгрузки данных пользователя в формате NDJSON
+    """
+    resp = client.get("/api/users/me/export", headers=headers)
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    records = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert records[0] == {
+        "type": "user",
+        "data": {
+            "id": 1,
+            "name": "Test User",
+            "followers_count": 0,
+            "following_count": 1,
+            "tweets_count": 1,
+            "likes_received_count": 0,
+        },
+    }
+    assert [r["type"] for r in records[1:]] == ["tweet", "like", "follow"]
+    assert "test-api-key" not in resp.data.decode()
+
+
+def summary(client: Any, headers: dict, user_id: int) -> dict:
+    return client.get(f"/api/users/{user_id}/summary", headers=headers).json["user"]
+
+
+def test_get_user_summary(client: Any, headers: dict) -> None:
+    """
+    Тестирование получения счётчиков пользователя
+    """
+    resp = client.get("/api/users/2/summary", headers=headers)
+
+    assert resp.status_code == 200
+    assert resp.json == {
+        "result": True,
+        "user": {
+            "id": 2,
+            "name": "Test User_2",
+            "followers_count": 1,
+            "following_count": 0,
+            "tweets_count": 1,
+            "likes_received_count": 1,
+        },
+    }
+
+
+def test_error_get_user_summary(client: Any, headers: dict) -> None:
+    """
+    Тестирование ошибки при получении счётчиков несуществующего пользователя
+    """
+    resp = client.get("/api/users/5/summary", headers=headers)
+
+    assert resp.status_code == 400
+    assert resp.json == {
+        "result": False,
+        "error_type": "NotFound",
+        "error_message": "User not found.",
+    }
+
+
+def test_counters_follow_lock_order(
+    client: Any, transaction: Any, headers: dict
+) -> None:
+    """
+    Тестирование порядка изменения счётчиков при подписке и отписке:
+    строки пользователей обновляются по возрастанию id независимо от того,
+    кто на кого подписывается
+    """
+    updated = []
+
+    def record_update(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE users"):
+            updated.append(parameters["id_1"])
+
+    event.listen(transaction, "before_cursor_execute", record_update)
+    client.post("/api/users/1/follow", headers={"api-key": "api-key_3"})
+    client.delete("/api/users/1/follow", headers={"api-key": "api-key_3"})
+    event.remove(transaction, "before_cursor_execute", record_update)
+
+    assert updated == [1, 3, 1, 3]
+
+
+def test_counters_follow_changes(client: Any, headers: dict) -> None:
+    """
+    Тестирование изменения счётчиков при подписках, твитах и лайках
+    """
+    client.post("/api/users/3/follow", headers=headers)
+    tweet_data = {"tweet_data": "New", "tweet_media_ids": [1]}
+    client.post("/api/tweets", data=tweet_data, headers=headers)
+    client.delete("/api/tweets/2/likes", headers=headers)
+
+    assert summary(client, headers, 1)["following_count"] == 2
+    assert summary(client, headers, 1)["tweets_count"] == 2
+    assert summary(client, headers, 2)["likes_received_count"] == 0
+    assert summary(client, headers, 3)["followers_count"] == 1
+
+    client.delete("/api/users/3/follow", headers=headers)
+    client.post("/api/tweets/1/likes", headers={"api-key": "api-key_2"})
+    client.delete("/api/tweets/1", headers=headers)
+
+    assert summary(client, headers, 1) == {
+        "id": 1,
+        "name": "Test User",
+        "followers_count": 0,
+        "following_count": 1,
+        "tweets_count": 1,
+        "likes_received_count": 0,
+    }
+    assert summary(client, headers, 3)["followers_count"] == 0
+
+
+def test_reconcile_counters(db: SQLAlchemy) -> None:
+    """
+    Тестирование исправления расхождений счётчиков
+    """
+    db.session.query(User).filter_by(id=2).update(
+        {User.followers_count: 7, User.likes_received_count: 0}
+    )
+    db.session.commit()
+
+    assert reconcile_counters(batch_size=2) == 1
+    assert reconcile_counters(batch_size=2) == 0
+    user = db.session.get(User, 2)
+    assert (user.followers_count, user.likes_received_count) == (1, 1)
+
+
+def test_migrate_counters(db: SQLAlchemy) -> None:
+    """
+    Тестирование добавления столбцов счётчиков в таблицу users,
+    созданную до их появления, и заполнения их фактическими значениями
+    """
+    db.session.execute(
+        text("ALTER TABLE users DROP COLUMN followers_count, DROP COLUMN tweets_count")
+    )
+    db.session.commit()
+
+    assert migrate_counters() == 2
+    assert migrate_counters() == 0
+    db.session.expire_all()
+    user = db.session.get(User, 2)
+    assert (user.followers_count, user.tweets_count) == (1, 1)
+
+
 def test_creat_user_factory(db: SQLAlchemy) -> None:
     """
     Тестирование создания фабрики пользователя
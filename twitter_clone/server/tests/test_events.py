@@ -0,0 +1,35 @@
+import zmq
+from api.events import EventBus, iter_sse, start_proxy  # type: ignore
+
+
+def test_event_bus_delivers_followed_users_events() -> None:
+    """
+    Тестирование доставки событий через шину только подписчикам автора
+    """
+    context = zmq.Context()
+    start_proxy("inproc://test_events_in", "inproc://test_events_out", context)
+    bus = EventBus("inproc://test_events_in", "inproc://test_events_out", context)
+    events = bus.subscribe([2], timeout=0.1)
+
+    event = None
+    for _ in range(50):
+        bus.publish(12, "tweet", {"id": 12})
+        bus.publish(2, "likes", {"tweet_id": 2, "count_likes": 3})
+        event = next(events)
+        if event is not None:
+            break
+
+    assert event == {"event": "likes", "data": {"tweet_id": 2, "count_likes": 3}}
+    events.close()
+
+
+def test_iter_sse_heartbeat() -> None:
+    """
+    Тестирование пинга в потоке server-sent events при отсутствии событий
+    """
+    bus = EventBus("inproc://test_sse_in", "inproc://test_sse_out", zmq.Context())
+    stream = iter_sse(bus, [2], heartbeat=0.01)
+
+    assert next(stream) == "retry: 3000\n\n"
+    assert next(stream) == ": ping\n\n"
+    stream.close()
@@ -0,0 +1,39 @@
+import os
+import time
+
+import zmq
+from api.events import METRICS_TOPIC, EventBus, start_proxy  # type: ignore
+from api.metrics import Metrics  # type: ignore
+
+
+def test_metrics_aggregate_workers() -> None:
+    """
+    Тестирование суммирования счётчиков, присланных другими воркерами через шину
+    """
+    context = zmq.Context()
+    start_proxy("inproc://test_metrics_in", "inproc://test_metrics_out", context)
+    bus = EventBus("inproc://test_metrics_in", "inproc://test_metrics_out", context)
+    metrics = Metrics(bus, publish_interval=0.05)
+    metrics.increment("compression.gzip.responses")
+    metrics.listen()
+
+    worker_pid = os.getpid() + 1
+    for _ in range(50):
+        bus.send(
+            METRICS_TOPIC,
+            "metrics",
+            {"pid": worker_pid, "metrics": {"compression.gzip.responses": 2}},
+        )
+        time.sleep(0.01)
+        total, pids = metrics.aggregate()
+        if worker_pid in pids:
+            break
+
+    assert total == {"compression.gzip.responses": 3}
+    assert pids == [os.getpid(), worker_pid]
+
+    time.sleep(0.2)
+    assert metrics.aggregate() == (
+        {"compression.gzip.responses": 1},
+        [os.getpid()],
+    )
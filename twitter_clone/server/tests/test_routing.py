@@ -0,0 +1,90 @@
+import time
+from typing import Any
+
+import pytest
+from db.models import Tweet  # type: ignore
+from db.routing import ReplicaHealth  # type: ignore
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
+
+
+def add_unreplicated_tweet(db: SQLAlchemy) -> None:
+    """
+    Твит пользователя 2 в транзакции теста: основная база его видит,
+    а реплика — нет, как ещё не дошедшее до неё изменение
+    """
+    db.session.add(Tweet(user_id=2, content="Not replicated", medias_ids=[]))
+    db.session.commit()
+    db.session.remove()
+
+
+def feed_size(client: Any, headers: dict) -> int:
+    return len(client.get("/api/tweets", headers=headers).json["tweets"])
+
+
+def test_read_only_session_uses_replica(db: SQLAlchemy) -> None:
+    """
+    Тестирование выбора реплики для чтения и основной базы для записи
+    """
+    add_unreplicated_tweet(db)
+    assert db.session.query(Tweet).count() == 3
+
+    db.session.remove()
+    db.session.info["read_only"] = True
+    assert db.session.query(Tweet).count() == 2
+
+    # Запись в реплику завершилась бы ошибкой: она только для чтения
+    db.session.add(Tweet(user_id=1, content="Written to primary", medias_ids=[]))
+    db.session.commit()
+    db.session.remove()
+    assert db.session.query(Tweet).count() == 4
+
+
+def test_handlers_routing(client: Any, db: SQLAlchemy, headers: dict) -> None:
+    """
+    Тестирование маршрутизации запросов обработчиков: чтение ленты — в реплику,
+    подписка — в основную базу
+    """
+    add_unreplicated_tweet(db)
+
+    assert feed_size(client, headers) == 1
+
+    resp = client.post("/api/users/3/follow", headers=headers)
+    assert resp.status_code == 201
+
+
+def test_read_your_writes(client: Any, db: SQLAlchemy, headers: dict) -> None:
+    """
+    Тестирование чтения из основной базы сразу после записи пользователя.
+    Срок хранится в cookie, поэтому его увидит любой воркер
+    """
+    add_unreplicated_tweet(db)
+    client.post("/api/users/3/follow", headers=headers)
+    cookie = client.get_cookie("read_primary_until")
+    assert float(cookie.value) > time.time()
+
+    assert feed_size(client, headers) == 2
+
+    client.delete_cookie("read_primary_until")
+    assert feed_size(client, headers) == 1
+
+
+def test_unavailable_replica(
+    app: Flask,
+    client: Any,
+    db: SQLAlchemy,
+    headers: dict,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    Тестирование чтения из основной базы, когда реплика не принимает подключения
+    """
+    health = ReplicaHealth(retry_seconds=30)
+    monkeypatch.setitem(app.extensions, "replica_health", health)
+    unavailable = create_engine("postgresql+psycopg2://admin:admin@db:1/twitter_test")
+    monkeypatch.setitem(db.engines, "replica_0", unavailable)
+    add_unreplicated_tweet(db)
+
+    assert feed_size(client, headers) == 2
+    assert not health.is_available("replica_0")
@@ -0,0 +1,88 @@
+import time
+from typing import Any
+
+import numpy as np
+import pytest
+from api.suggestions import (  # type: ignore
+    compute_suggestions,
+    load_follow_graph,
+    score_chunk,
+    top_candidates,
+)
+from db.models import Follow  # type: ignore
+from flask_sqlalchemy import SQLAlchemy
+from scipy import sparse
+
+
+def test_score_chunk() -> None:
+    """
+    Тестирование оценок «друзей друзей» и подписчиков без взаимной подписки
+    """
+    # 1 -> 2, 1 -> 3, 2 -> 4, 3 -> 4, 3 -> 1, 4 -> 1
+    rows = [1, 1, 2, 3, 3, 4]
+    cols = [2, 3, 4, 4, 1, 1]
+    graph = sparse.csr_matrix((np.ones(6), (rows, cols)), shape=(5, 5))
+
+    scores = score_chunk(graph, graph.T.tocsr(), 1, 3).toarray()
+
+    # У 1 два общих знакомых с 4, а 4 ещё и подписан на 1; 3 уже в подписках
+    assert scores[0].tolist() == [0, 0, 0, 0, 4]
+    # У 2 один общий знакомый с 1 (через 4), и 1 подписан на 2
+    assert scores[1].tolist() == [0, 3, 0, 0, 0]
+
+
+def test_top_candidates() -> None:
+    """
+    Тестирование выбора лучших кандидатов: по убыванию оценки,
+    при равенстве — по возрастанию id, не больше top_n на пользователя
+    """
+    scores = sparse.csr_matrix(
+        np.array([[0, 1, 3, 1, 2], [0, 0, 0, 0, 0], [5, 0, 0, 0, 1]], dtype=np.float32)
+    )
+
+    user_ids, ranks, candidate_ids, values = top_candidates(scores, 10, 3)
+
+    assert user_ids.tolist() == [10, 10, 10, 12, 12]
+    assert ranks.tolist() == [1, 2, 3, 1, 2]
+    assert candidate_ids.tolist() == [2, 4, 1, 0, 4]
+    assert values.tolist() == [3, 2, 1, 5, 1]
+
+
+def test_load_follow_graph(db: SQLAlchemy) -> None:
+    """
+    Тестирование загрузки матрицы подписок
+    """
+    db.session.add(Follow(follower_id=3, followed_id=1))
+    db.session.commit()
+
+    graph = load_follow_graph(batch_size=1)
+
+    assert graph.shape == (4, 4)
+    assert sorted(zip(*graph.nonzero())) == [(1, 2), (3, 1)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_get_my_suggestions(
+    client: Any, db: SQLAlchemy, headers: dict, workers: int
+) -> None:
+    """
+    Тестирование расчёта и получения рекомендаций
+    """
+    db.session.add(Follow(follower_id=2, followed_id=3))
+    db.session.commit()
+
+    assert compute_suggestions(top_n=5, chunk_size=2, workers=workers) == 3
+
+    # Реплика в тестах не видит изменений теста: читаем из основной базы,
+    # как после записи
+    client.set_cookie("read_primary_until", str(time.time() + 60))
+    resp = client.get("/api/users/me/suggestions", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json == {
+        "result": True,
+        "users": [{"id": 3, "name": "Test User_3", "score": 1.0}],
+    }
+
+    client.post("/api/users/3/follow", headers=headers)
+    resp = client.get("/api/users/me/suggestions", headers=headers)
+    assert resp.json["users"] == []
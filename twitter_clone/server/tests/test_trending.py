@@ -0,0 +1,98 @@
+from typing import Any
+
+from api.trending import TrendingTweets  # type: ignore
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_trending_top_k() -> None:
+    """
+    Тестирование порядка и размера топа популярных твитов
+    """
+    trending = TrendingTweets(window=60, buckets=6, top_k=2, clock=FakeClock())
+    for tweet_id, likes in [(1, 1), (2, 3), (3, 2)]:
+        for _ in range(likes):
+            trending.record(tweet_id, 1)
+
+    assert trending.top() == [(2, 3), (3, 2)]
+
+    for _ in range(3):
+        trending.record(2, -1)
+
+    assert trending.top() == [(3, 2), (1, 1)]
+
+
+def test_trending_sliding_window() -> None:
+    """
+    Тестирование выхода старых лайков из окна
+    """
+    clock = FakeClock()
+    trending = TrendingTweets(window=60, buckets=6, top_k=10, clock=clock)
+    trending.record(1, 1)
+    trending.record(1, 1)
+    clock.now = 30
+    trending.record(2, 1)
+
+    assert trending.top() == [(1, 2), (2, 1)]
+
+    clock.now = 65
+    assert trending.top() == [(2, 1)]
+
+    clock.now = 95
+    assert trending.top() == []
+
+
+def test_trending_checkpoint(tmp_path: Any) -> None:
+    """
+    Тестирование восстановления топа из контрольной точки
+    """
+    clock = FakeClock()
+    path = str(tmp_path / "trending.json")
+    trending = TrendingTweets(window=60, buckets=6, checkpoint_path=path, clock=clock)
+    trending.record(1, 1)
+    trending.record(2, 1)
+    trending.record(2, 1)
+    trending.checkpoint()
+
+    restored = TrendingTweets(window=60, buckets=6, checkpoint_path=path, clock=clock)
+
+    assert restored.top() == [(2, 2), (1, 1)]
+
+
+def test_trending_reload(tmp_path: Any) -> None:
+    """
+    Тестирование перезагрузки окна из контрольной точки, записанной позже,
+    чем окно было загружено
+    """
+    clock = FakeClock()
+    path = str(tmp_path / "trending.json")
+    stale = TrendingTweets(window=60, buckets=6, checkpoint_path=path, clock=clock)
+    stale.record(3, 1)
+    trending = TrendingTweets(window=60, buckets=6, checkpoint_path=path, clock=clock)
+    trending.record(1, 1)
+    trending.record(2, 1)
+    trending.checkpoint()
+
+    stale.reload()
+
+    assert stale.top() == [(2, 1), (1, 1)]
+
+
+def test_trending_discard() -> None:
+    """
+    Тестирование удаления твита из окна и топа
+    """
+    trending = TrendingTweets(window=60, buckets=6, top_k=1, clock=FakeClock())
+    trending.record(1, 1)
+    trending.record(1, 1)
+    trending.record(2, 1)
+
+    trending.discard(1)
+
+    assert trending.top() == [(2, 1)]